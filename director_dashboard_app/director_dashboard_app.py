@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 from datetime import datetime
-import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+from query_executor import run_concurrently
+import io
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -19,289 +21,412 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# ==============================
+# DATABASE
+# ==============================
+CACHE_TTL = 300  # seconds a cached KPI result stays fresh
+REFERENCE_TTL = 3600  # seconds for near-static reference data (seat counts, distances)
+POOL_MIN_CONN = 2  # warm connections kept open between reruns
+# ThreadedConnectionPool raises PoolError instead of waiting once every
+# connection is checked out, so leave room for the QUERY_WORKERS threads in
+# query_executor.py plus every session querying from its own script thread.
+# Keep it well under the server's max_connections.
+POOL_MAX_CONN = 25
+
+
+@st.cache_resource
+def get_pool():
+    """Create the connection pool shared by every rerun and session."""
+    return ThreadedConnectionPool(
+        POOL_MIN_CONN,
+        POOL_MAX_CONN,
+        host=st.secrets["postgres"]["host"],
+        port=st.secrets["postgres"]["port"],
+        database=st.secrets["postgres"]["database"],
+        user=st.secrets["postgres"]["user"],
+        password=st.secrets["postgres"]["password"]
+    )
+
+
+# The query helpers raise on failure instead of returning an empty result:
+# they run inside st.cache_data functions, which would otherwise cache the
+# fallback for every session. Callers outside the cache report the error.
+
+def run_query(query, params=None):
+    """Execute a one-row KPI query on a pooled connection.
+
+    Text results go through read_query_frame(), which replaces corrupted
+    UTF-8; the queries run here return numbers, timestamps and JSON only.
+    """
+    pool = get_pool()
+    connection = pool.getconn()
+
+    try:
+        # Read-only dashboard: a failed query must not leave the pooled
+        # connection stuck in an aborted transaction.
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            colnames = [desc[0] for desc in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=colnames)
+    finally:
+        pool.putconn(connection)
+
+
+def copy_query_csv(query, params=None):
+    """Export query results as CSV bytes with COPY ... TO STDOUT on a pooled connection."""
+    pool = get_pool()
+    connection = pool.getconn()
+
+    try:
+        connection.autocommit = True
+        buffer = io.BytesIO()
+        with connection.cursor() as cursor:
+            # COPY takes no bind parameters, so they are interpolated client-side.
+            copy_sql = b"COPY (" + cursor.mogrify(query, params) + b") TO STDOUT WITH CSV HEADER"
+            cursor.copy_expert(copy_sql, buffer)
+        return buffer.getvalue()
+    finally:
+        pool.putconn(connection)
+
+
+def read_query_frame(query, column_types, params=None):
+    """Load a multi-row result through COPY and Arrow's CSV reader.
+
+    Rows never become Python tuples: Postgres streams CSV, which is decoded
+    in one pass (replacing corrupted UTF-8) and parsed by Arrow's
+    multithreaded reader into pyarrow-backed columns. column_types gives
+    the pyarrow type of every column; CSV text carries no SQL types, and
+    inferring them would turn money into floats and numeric-looking names
+    into integers.
+    """
+    text = copy_query_csv(query, params).decode("utf-8", errors="replace").encode("utf-8")
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types,
+        # COPY writes NULL as an empty unquoted field and '' as a quoted one
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False
+    )
+    table = pa_csv.read_csv(io.BytesIO(text), convert_options=convert_options)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def window_start(lookback):
+    """Today minus a pd.DateOffset, as a date; month offsets clamp to month end like Postgres intervals."""
+    return (pd.Timestamp.today().normalize() - lookback).date()
+
+
+# ==============================
+# CACHED QUERIES
+# ==============================
+# Each query is cached on its window start date, so reruns with unchanged
+# inputs (widget interactions, period switches back and forth) skip Postgres,
+# and the key rolls over by itself at midnight.
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_all_kpis(start_date):
+    """Headline KPIs in a single round-trip over the daily materialized views."""
+    query = """
+    WITH txn AS (
+        SELECT 
+            COALESCE(SUM(rev), 0) as gross_revenue,
+            COALESCE(SUM(rev), 0) - COALESCE(SUM(exp), 0) as net_profit
+        FROM mv_daily_revenue
+        WHERE d >= %(start_date)s
+    ),
+    comm AS (
+        SELECT COALESCE(SUM(commissions), 0) as total_commissions
+        FROM mv_daily_commissions 
+        WHERE d >= %(start_date)s
+    ),
+    fleet AS (
+        SELECT 
+            COUNT(DISTINCT v.id) as total_vehicles,
+            COUNT(DISTINCT vs.vehicle_id) as active_vehicles,
+            CASE WHEN COUNT(DISTINCT v.id) > 0 THEN
+                ROUND((COUNT(DISTINCT vs.vehicle_id) * 100.0 / COUNT(DISTINCT v.id))::numeric, 2)
+            ELSE 0 END as utilization_rate
+        FROM vehicles v
+        LEFT JOIN vehicle_schedules vs ON v.id = vs.vehicle_id 
+        WHERE v.status = true
+    ),
+    bk AS (
+        SELECT COALESCE(SUM(booking_count), 0) as total_bookings
+        FROM mv_daily_bookings
+        WHERE d >= %(start_date)s
+    )
+    SELECT 
+        txn.*,
+        comm.*,
+        fleet.*,
+        bk.*,
+        CASE WHEN fleet.total_vehicles > 0 THEN
+            ROUND((txn.gross_revenue / fleet.total_vehicles)::numeric, 2)
+        ELSE 0 END as rofa,
+        (SELECT refreshed_at FROM dashboard_matview_refresh) as data_as_of
+    FROM txn, comm, fleet, bk
+    """
+    kpis = dict.fromkeys(
+        ['gross_revenue', 'net_profit', 'total_commissions',
+         'utilization_rate', 'active_vehicles', 'total_vehicles', 'rofa',
+         'total_bookings'],
+        0
+    )
+    kpis['data_as_of'] = None
+    df = run_query(query, {'start_date': start_date})
+    if not df.empty:
+        kpis.update(df.iloc[0].to_dict())
+    return kpis
+
+
+@st.cache_data(ttl=REFERENCE_TTL, show_spinner=False)
+def fetch_avg_seats():
+    query = """
+    SELECT COALESCE(AVG(total_seat), 40) as avg_seats 
+    FROM fleet_types 
+    WHERE total_seat > 0
+    """
+    df = run_query(query)
+    if df.empty or 'avg_seats' not in df.columns:
+        return 40.0
+    return float(df['avg_seats'].iloc[0])
+
+
+@st.cache_data(ttl=REFERENCE_TTL, show_spinner=False)
+def fetch_avg_distance():
+    query = """
+    SELECT COALESCE(AVG(distance), 100) as avg_distance 
+    FROM route_segments 
+    WHERE distance > 0
+    """
+    df = run_query(query)
+    if df.empty or 'avg_distance' not in df.columns:
+        return 100.0
+    return float(df['avg_distance'].iloc[0])
+
+
+def compute_rask_simple(start_date):
+    """RASK from the batched KPI totals; no query of its own once those are cached."""
+    kpis = fetch_all_kpis(start_date)
+    # Seat and distance averages are near-static reference data, cached
+    # far longer than the window-dependent totals.
+    estimated_ask = float(kpis['total_bookings']) * fetch_avg_seats() * fetch_avg_distance()
+    if estimated_ask <= 0:
+        return 0
+    return round(float(kpis['gross_revenue']) / estimated_ask, 4)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_booking_overview(start_date):
+    """Customer retention and bookings per channel from a single scan of bookings.
+
+    Returns a dict with 'retention' (one row) and 'sources' (one row per
+    channel, by revenue) DataFrames.
+    """
+    query = """
+    WITH b AS MATERIALIZED (
+        SELECT passenger_id, total_price, channel_category
+        FROM bookings
+        WHERE created_at >= %(start_date)s
+    ),
+    customer_bookings AS (
+        SELECT 
+            passenger_id,
+            COUNT(*) as booking_count
+        FROM b
+        GROUP BY passenger_id
+    ),
+    retention AS (
+        SELECT 
+            COUNT(*) as total_customers,
+            COUNT(*) FILTER (WHERE booking_count > 1) as returning_customers
+        FROM customer_bookings
+    ),
+    totals AS (
+        SELECT 
+            COUNT(*) as all_count,
+            COALESCE(SUM(total_price), 0) as all_revenue,
+            COUNT(*) FILTER (WHERE channel_category = 'web') as web_count,
+            COALESCE(SUM(total_price) FILTER (WHERE channel_category = 'web'), 0) as web_revenue,
+            COUNT(*) FILTER (WHERE channel_category = 'pos') as pos_count,
+            COALESCE(SUM(total_price) FILTER (WHERE channel_category = 'pos'), 0) as pos_revenue,
+            COUNT(*) FILTER (WHERE channel_category = 'mobile') as mobile_count,
+            COALESCE(SUM(total_price) FILTER (WHERE channel_category = 'mobile'), 0) as mobile_revenue,
+            COUNT(*) FILTER (WHERE channel_category = 'b2b') as b2b_count,
+            COALESCE(SUM(total_price) FILTER (WHERE channel_category = 'b2b'), 0) as b2b_revenue
+        FROM b
+    ),
+    sources AS (
+        SELECT s.source_type, s.booking_count, s.total_revenue
+        FROM totals t
+        CROSS JOIN LATERAL (VALUES
+            ('All Channels', t.all_count, t.all_revenue),
+            ('Web', t.web_count, t.web_revenue),
+            ('POS', t.pos_count, t.pos_revenue),
+            ('Mobile', t.mobile_count, t.mobile_revenue),
+            ('B2B', t.b2b_count, t.b2b_revenue)
+        ) as s(source_type, booking_count, total_revenue)
+    )
+    SELECT json_build_object(
+        'retention', (SELECT row_to_json(r) FROM retention r),
+        'sources', (SELECT json_agg(s ORDER BY s.total_revenue DESC) FROM sources s)
+    ) as overview
+    """
+    df = run_query(query, {'start_date': start_date})
+    if df.empty or 'overview' not in df.columns:
+        return {'retention': pd.DataFrame(), 'sources': pd.DataFrame()}
+    overview = df['overview'].iloc[0]
+    retention = pd.DataFrame([overview['retention']])
+    total = retention['total_customers'].iloc[0]
+    returning = retention['returning_customers'].iloc[0]
+    retention['retention_rate'] = round(returning * 100.0 / total, 2) if total > 0 else 0
+    return {
+        'retention': retention,
+        'sources': pd.DataFrame(overview['sources'])
+    }
+
+
+# Report queries are shared between the dashboard frames and the CSV
+# exports; both stream them through COPY. Money columns are cast to a fixed
+# scale so they parse into the declared decimal types.
+TRENDS_LOOKBACK = pd.DateOffset(months=6)
+MONTHLY_TRENDS_QUERY = """
+SELECT 
+    DATE_TRUNC('month', d)::date as month,
+    SUM(booking_count)::bigint as booking_count,
+    COALESCE(SUM(revenue), 0)::numeric(20, 2) as revenue,
+    (0.6 * COALESCE(SUM(positive_revenue), 0))::numeric(20, 3) as estimated_cost
+FROM mv_daily_bookings
+WHERE d >= %(start_date)s
+GROUP BY DATE_TRUNC('month', d)::date
+ORDER BY month
+"""
+MONTHLY_TRENDS_TYPES = {
+    'month': pa.date32(),
+    'booking_count': pa.int64(),
+    'revenue': pa.decimal128(20, 2),
+    'estimated_cost': pa.decimal128(20, 3),
+}
+
+AGENCY_PROFITABILITY_QUERY = """
+SELECT 
+    a.name as agency,
+    COALESCE(SUM(ar.debit), 0)::numeric(20, 2) as revenue,
+    COALESCE(SUM(ar.credit), 0)::numeric(20, 2) as cost,
+    COALESCE(SUM(ar.net), 0)::numeric(20, 2) as net_profit,
+    CASE WHEN COALESCE(SUM(ar.debit), 0) > 0 THEN
+        ROUND(((COALESCE(SUM(ar.net), 0) * 100.0 / COALESCE(SUM(ar.debit), 0))::numeric), 2)
+    ELSE 0 END as profit_margin
+FROM mv_agency_profitability ar
+JOIN agencies a ON a.id = ar.agency_id
+WHERE ar.d >= %(start_date)s
+GROUP BY a.name
+HAVING COALESCE(SUM(ar.debit), 0) > 0
+ORDER BY net_profit DESC
+LIMIT 10
+"""
+AGENCY_PROFITABILITY_TYPES = {
+    'agency': pa.string(),
+    'revenue': pa.decimal128(20, 2),
+    'cost': pa.decimal128(20, 2),
+    'net_profit': pa.decimal128(20, 2),
+    'profit_margin': pa.decimal128(20, 2),
+}
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_monthly_trends(start_date):
+    return read_query_frame(MONTHLY_TRENDS_QUERY, MONTHLY_TRENDS_TYPES, {'start_date': start_date})
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_agency_profitability(start_date):
+    return read_query_frame(AGENCY_PROFITABILITY_QUERY, AGENCY_PROFITABILITY_TYPES, {'start_date': start_date})
+
+
 # ==============================
 # DASHBOARD CLASS
 # ==============================
 class DirectorDashboard:
     def __init__(self, period="30d"):
-        self.connection = None
-        self.connect()
         self.last_update = datetime.now()
         self.set_period(period)
 
     def set_period(self, period):
         self.period_label = period
         if period == "30d":
-            self.interval = "30 days"
+            self.lookback = pd.DateOffset(days=30)
         elif period == "60d":
-            self.interval = "60 days"
+            self.lookback = pd.DateOffset(days=60)
         elif period == "365d":
-            self.interval = "365 days"
+            self.lookback = pd.DateOffset(days=365)
         elif period == "6m":
-            self.interval = "6 months"
+            self.lookback = pd.DateOffset(months=6)
         else:
-            self.interval = "30 days"
-
-    def connect(self):
-        try:
-            self.connection = psycopg2.connect(
-                host=st.secrets["postgres"]["host"],
-                port=st.secrets["postgres"]["port"],
-                database=st.secrets["postgres"]["database"],
-                user=st.secrets["postgres"]["user"],
-                password=st.secrets["postgres"]["password"]
-            )
-        except Exception as e:
-            st.error(f"❌ Error connecting to database: {e}")
-
-    def execute_query(self, query):
-        """Execute query and safely handle corrupted UTF-8 bytes."""
-        try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(query)
-                colnames = [desc[0] for desc in cursor.description]
-                data = cursor.fetchall()
-
-                safe_data = []
-                for row in data:
-                    safe_row = []
-                    for val in row:
-                        if isinstance(val, bytes):
-                            safe_row.append(val.decode("utf-8", errors="replace"))
-                        else:
-                            safe_row.append(val)
-                    safe_data.append(safe_row)
-
-                return pd.DataFrame(safe_data, columns=colnames)
-        except Exception as e:
-            st.error(f"Query error: {e}")
-            return pd.DataFrame()
-
-    def close(self):
-        if self.connection:
-            self.connection.close()
+            self.lookback = pd.DateOffset(days=30)
+
+    @property
+    def start_date(self):
+        """First day of the analysis window, bound into queries as a plain date.
+
+        Computed on access because dashboards outlive the day they were built.
+        """
+        return window_start(self.lookback)
+
+    def get_all_kpis(self):
+        return fetch_all_kpis(self.start_date)
+
+    # The individual KPI getters all read the single batched KPI row.
 
     # ==============================
     # FINANCIAL KPIs
     # ==============================
     def get_gross_revenue(self):
-        query = f"""
-        SELECT COALESCE(SUM(debit), 0) as gross_revenue 
-        FROM transactions 
-        WHERE type = 'revenue' 
-        AND date >= CURRENT_DATE - INTERVAL '{self.interval}'
-        """
-        df = self.execute_query(query)
-        if df.empty or 'gross_revenue' not in df.columns:
-            return 0
-        return df['gross_revenue'].iloc[0]
+        return self.get_all_kpis()['gross_revenue']
 
     def get_net_profit(self):
-        query = f"""
-        SELECT 
-            COALESCE(SUM(CASE WHEN type = 'revenue' THEN debit ELSE 0 END), 0) - 
-            COALESCE(SUM(CASE WHEN type = 'expense' THEN credit ELSE 0 END), 0) as net_profit
-        FROM transactions
-        WHERE date >= CURRENT_DATE - INTERVAL '{self.interval}'
-        """
-        df = self.execute_query(query)
-        if df.empty or 'net_profit' not in df.columns:
-            return 0
-        return df['net_profit'].iloc[0]
+        return self.get_all_kpis()['net_profit']
 
     def get_commission_costs(self):
-        query = f"""
-        SELECT COALESCE(SUM(value), 0) as total_commissions
-        FROM agency_commissions 
-        WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        """
-        df = self.execute_query(query)
-        if df.empty or 'total_commissions' not in df.columns:
-            return 0
-        return df['total_commissions'].iloc[0]
+        return self.get_all_kpis()['total_commissions']
 
     # ==============================
     # OPERATIONAL KPIs
     # ==============================
     def get_fleet_utilization(self):
-        query = """
-        SELECT 
-            COUNT(DISTINCT v.id) as total_vehicles,
-            COUNT(DISTINCT vs.vehicle_id) as active_vehicles,
-            CASE WHEN COUNT(DISTINCT v.id) > 0 THEN
-                ROUND((COUNT(DISTINCT vs.vehicle_id) * 100.0 / COUNT(DISTINCT v.id))::numeric, 2)
-            ELSE 0 END as utilization_rate
-        FROM vehicles v
-        LEFT JOIN vehicle_schedules vs ON v.id = vs.vehicle_id 
-        WHERE v.status = true
-        """
-        df = self.execute_query(query)
-        if df.empty:
-            return 0, 0, 0
-        return df['utilization_rate'].iloc[0], df['active_vehicles'].iloc[0], df['total_vehicles'].iloc[0]
+        kpis = self.get_all_kpis()
+        return kpis['utilization_rate'], kpis['active_vehicles'], kpis['total_vehicles']
 
     def get_rofa(self):
-        query = f"""
-        SELECT 
-            COALESCE(SUM(t.debit), 0) as total_revenue,
-            COUNT(DISTINCT v.id) as total_fleet,
-            CASE WHEN COUNT(DISTINCT v.id) > 0 THEN
-                ROUND((COALESCE(SUM(t.debit), 0) / COUNT(DISTINCT v.id))::numeric, 2)
-            ELSE 0 END as rofa
-        FROM transactions t
-        CROSS JOIN vehicles v
-        WHERE t.type = 'revenue' 
-        AND t.date >= CURRENT_DATE - INTERVAL '{self.interval}'
-        AND v.status = true
-        """
-        df = self.execute_query(query)
-        if df.empty:
-            return 0, 0, 0
-        return df['rofa'].iloc[0], df['total_revenue'].iloc[0], df['total_fleet'].iloc[0]
+        kpis = self.get_all_kpis()
+        return kpis['rofa'], kpis['gross_revenue'], kpis['total_vehicles']
 
     def get_rask_simple(self):
-        query = f"""
-        WITH revenue_data AS (
-            SELECT COALESCE(SUM(t.debit), 0) as total_revenue
-            FROM transactions t
-            WHERE t.type = 'revenue' 
-            AND t.date >= CURRENT_DATE - INTERVAL '{self.interval}'
-        ),
-        booking_count AS (
-            SELECT COUNT(*) as total_bookings
-            FROM bookings 
-            WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        ),
-        avg_seats AS (
-            SELECT COALESCE(AVG(total_seat), 40) as avg_seats 
-            FROM fleet_types 
-            WHERE total_seat > 0
-        ),
-        avg_distance AS (
-            SELECT COALESCE(AVG(distance), 100) as avg_distance 
-            FROM route_segments 
-            WHERE distance > 0
-        )
-        SELECT 
-            r.total_revenue,
-            b.total_bookings * s.avg_seats * d.avg_distance as estimated_ask,
-            CASE WHEN (b.total_bookings * s.avg_seats * d.avg_distance) > 0 THEN
-                ROUND((r.total_revenue / (b.total_bookings * s.avg_seats * d.avg_distance))::numeric, 4)
-            ELSE 0 END as rask
-        FROM revenue_data r, booking_count b, avg_seats s, avg_distance d
-        """
-        df = self.execute_query(query)
-        if df.empty or 'rask' not in df.columns:
-            return 0
-        return df['rask'].iloc[0]
+        return compute_rask_simple(self.start_date)
 
     # ==============================
     # CUSTOMER & BOOKING KPIs
     # ==============================
     def get_customer_retention(self):
-        query = f"""
-        WITH customer_bookings AS (
-            SELECT 
-                passenger_id,
-                COUNT(*) as booking_count,
-                MIN(created_at) as first_booking,
-                MAX(created_at) as last_booking
-            FROM bookings
-            WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-            GROUP BY passenger_id
-        )
-        SELECT 
-            COUNT(*) as total_customers,
-            COUNT(CASE WHEN booking_count > 1 THEN 1 END) as returning_customers,
-            CASE WHEN COUNT(*) > 0 THEN
-                ROUND((COUNT(CASE WHEN booking_count > 1 THEN 1 END) * 100.0 / COUNT(*))::numeric, 2)
-            ELSE 0 END as retention_rate
-        FROM customer_bookings
-        """
-        return self.execute_query(query)
+        return fetch_booking_overview(self.start_date)['retention']
 
     def get_booking_sources(self):
-        query = f"""
-        SELECT 
-            'All Channels' as source_type,
-            COUNT(*) as booking_count,
-            COALESCE(SUM(total_price), 0) as total_revenue
-        FROM bookings
-        WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        UNION ALL
-        SELECT 
-            'Web' as source_type,
-            COUNT(*) as booking_count,
-            COALESCE(SUM(total_price), 0) as total_revenue
-        FROM bookings
-        WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        AND (booking_channel LIKE '%web%' OR booking_channel LIKE '%online%' OR booking_channel IS NULL)
-        UNION ALL
-        SELECT 
-            'POS' as source_type,
-            COUNT(*) as booking_count,
-            COALESCE(SUM(total_price), 0) as total_revenue
-        FROM bookings
-        WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        AND (booking_channel LIKE '%pos%' OR booking_channel LIKE '%counter%')
-        UNION ALL
-        SELECT 
-            'Mobile' as source_type,
-            COUNT(*) as booking_count,
-            COALESCE(SUM(total_price), 0) as total_revenue
-        FROM bookings
-        WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        AND (booking_channel LIKE '%mobile%' OR booking_channel LIKE '%app%')
-        UNION ALL
-        SELECT 
-            'B2B' as source_type,
-            COUNT(*) as booking_count,
-            COALESCE(SUM(total_price), 0) as total_revenue
-        FROM bookings
-        WHERE created_at >= CURRENT_DATE - INTERVAL '{self.interval}'
-        AND (booking_channel LIKE '%b2b%' OR booking_channel LIKE '%corporate%')
-        ORDER BY total_revenue DESC
-        """
-        return self.execute_query(query)
+        return fetch_booking_overview(self.start_date)['sources']
 
     def get_monthly_trends(self):
-        query = f"""
-        SELECT 
-            DATE_TRUNC('month', created_at) as month,
-            COUNT(id) as booking_count,
-            COALESCE(SUM(total_price), 0) as revenue,
-            COALESCE(SUM(
-                CASE 
-                    WHEN total_price > 0 THEN total_price * 0.6
-                    ELSE 0 
-                END
-            ), 0) as estimated_cost
-        FROM bookings
-        WHERE created_at >= CURRENT_DATE - INTERVAL '6 months'
-        GROUP BY DATE_TRUNC('month', created_at)
-        ORDER BY month
-        """
-        return self.execute_query(query)
+        return fetch_monthly_trends(window_start(TRENDS_LOOKBACK))
 
     def get_agency_profitability(self):
-        query = f"""
-        SELECT 
-            a.name as agency,
-            COALESCE(SUM(ar.debit), 0) as revenue,
-            COALESCE(SUM(ar.credit), 0) as cost,
-            COALESCE(SUM(ar.debit - ar.credit), 0) as net_profit,
-            CASE WHEN COALESCE(SUM(ar.debit), 0) > 0 THEN
-                ROUND(((COALESCE(SUM(ar.debit - ar.credit), 0) * 100.0 / COALESCE(SUM(ar.debit), 0))::numeric), 2)
-            ELSE 0 END as profit_margin
-        FROM agencies a
-        LEFT JOIN agency_reports ar ON a.id = ar.agency_id
-        WHERE ar.date >= CURRENT_DATE - INTERVAL '{self.interval}'
-        GROUP BY a.name
-        HAVING COALESCE(SUM(ar.debit), 0) > 0
-        ORDER BY net_profit DESC
-        LIMIT 10
-        """
-        return self.execute_query(query)
+        return fetch_agency_profitability(self.start_date)
+
+@st.cache_resource
+def get_dashboard(period):
+    """One DirectorDashboard per period, reused across reruns and sessions.
+
+    Keyed on the period rather than shared and re-pointed with set_period(),
+    so concurrent sessions never see each other's window.
+    """
+    return DirectorDashboard(period)
 
 # ==============================
 # STREAMLIT APP
@@ -311,49 +436,83 @@ def main():
 
     # Sidebar
     with st.sidebar:
-        st.header("Settings")
-        period = st.selectbox(
-            "Analysis Period",
-            options=["30d", "60d", "365d", "6m"],
-            index=0,
-            help="Select the time period for analysis"
-        )
-
         st.header("Quick Actions")
         if st.button("🔄 Refresh Data"):
-            st.rerun()
+            # The click already reruns the script; dropping the caches makes
+            # this run go back to Postgres with fresh dashboards.
+            st.cache_data.clear()
+            get_dashboard.clear()
 
         if st.button("📊 Download Reports"):
-            download_reports()
+            # The period selector lives in the KPI fragment below; its value
+            # from the previous run is in session state.
+            download_reports(get_dashboard(st.session_state.get("period", "30d")))
 
     # Dashboard
-    dashboard = DirectorDashboard(period)
+    render_kpis()
+
+
+@st.fragment
+def render_kpis():
+    """KPI grid and its period selector.
+
+    Changing the period reruns only this fragment, not the header, sidebar
+    and layout around it.
+    """
+    period = st.selectbox(
+        "Analysis Period",
+        options=["30d", "60d", "365d", "6m"],
+        index=0,
+        help="Select the time period for analysis",
+        key="period"
+    )
+    dashboard = get_dashboard(period)
 
     # KPIs
+    try:
+        kpis = dashboard.get_all_kpis()
+    except Exception as e:
+        st.error(f"❌ Error loading KPIs: {e}")
+        return
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        revenue = dashboard.get_gross_revenue()
+        revenue = kpis['gross_revenue']
         st.metric("Gross Revenue", f"${revenue:,.2f}")
     with col2:
-        profit = dashboard.get_net_profit()
+        profit = kpis['net_profit']
         st.metric("Net Profit", f"${profit:,.2f}", delta_color="inverse" if profit < 0 else "normal")
     with col3:
-        commission = dashboard.get_commission_costs()
+        commission = kpis['total_commissions']
         st.metric("Commission Costs", f"${commission:,.2f}")
     with col4:
-        utilization, active, total = dashboard.get_fleet_utilization()
+        utilization, active, total = kpis['utilization_rate'], kpis['active_vehicles'], kpis['total_vehicles']
         st.metric("Fleet Utilization", f"{utilization}%", f"{active}/{total} vehicles")
+    # Revenue, commissions and bookings come from the materialized views
+    if pd.notna(kpis['data_as_of']):
+        st.caption(f"Revenue, commission and booking figures as of {kpis['data_as_of']:%Y-%m-%d %H:%M %Z}")
 
 # ==============================
 # REPORT DOWNLOADS
 # ==============================
-def download_reports():
-    dashboard = DirectorDashboard()
-    trends = dashboard.get_monthly_trends()
-    agencies = dashboard.get_agency_profitability()
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_report_csv(period, report):
+    """CSV export of one report, produced server-side by COPY and cached on (period, report)."""
+    if report == 'trends':
+        return copy_query_csv(MONTHLY_TRENDS_QUERY, {'start_date': window_start(TRENDS_LOOKBACK)})
+    return copy_query_csv(AGENCY_PROFITABILITY_QUERY, {'start_date': get_dashboard(period).start_date})
+
 
-    csv1 = trends.to_csv(index=False)
-    csv2 = agencies.to_csv(index=False)
+def download_reports(dashboard):
+    period = dashboard.period_label
+    try:
+        results = run_concurrently({
+            'trends': lambda: fetch_report_csv(period, 'trends'),
+            'agencies': lambda: fetch_report_csv(period, 'agencies'),
+        })
+    except Exception as e:
+        st.error(f"❌ Error exporting reports: {e}")
+        return
+    csv1, csv2 = results['trends'], results['agencies']
 
     st.download_button("📥 Download Monthly Trends", csv1, "monthly_trends.csv", "text/csv")
     st.download_button("📥 Download Agency Performance", csv2, "agency_performance.csv", "text/csv")
@@ -0,0 +1,106 @@
+-- ==============================
+-- DIRECTOR DASHBOARD MATERIALIZED VIEWS
+-- ==============================
+-- Daily roll-ups of the tables the dashboard aggregates. KPI queries sum a
+-- handful of day rows instead of re-aggregating the raw tables on every load.
+-- Each view has a UNIQUE index so it can be refreshed CONCURRENTLY (readers
+-- are never blocked while it rebuilds).
+-- The day column d is a plain date, so window comparisons against a date
+-- parameter do not depend on the session time zone.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_daily_revenue AS
+SELECT
+    date::date AS d,
+    SUM(debit) FILTER (WHERE type = 'revenue') AS rev,
+    SUM(credit) FILTER (WHERE type = 'expense') AS exp
+FROM transactions
+WHERE date IS NOT NULL
+GROUP BY 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_daily_revenue_d_idx ON mv_daily_revenue (d);
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_daily_commissions AS
+SELECT
+    created_at::date AS d,
+    SUM(value) AS commissions
+FROM agency_commissions
+WHERE created_at IS NOT NULL
+GROUP BY 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_daily_commissions_d_idx ON mv_daily_commissions (d);
+
+-- positive_revenue is the plain SUM(GREATEST(total_price, 0)): the dashboard
+-- applies its 0.6 cost ratio once per month after aggregation, so the ratio
+-- is not baked into the view. (GREATEST ignores NULLs, like a CASE ... ELSE 0.)
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_daily_bookings AS
+SELECT
+    created_at::date AS d,
+    COUNT(id) AS booking_count,
+    SUM(total_price) AS revenue,
+    SUM(GREATEST(total_price, 0)) AS positive_revenue
+FROM bookings
+WHERE created_at IS NOT NULL
+GROUP BY 1;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_daily_bookings_d_idx ON mv_daily_bookings (d);
+
+-- Monthly trends are summed from mv_daily_bookings rather than a monthly
+-- view: the "last 6 months" window starts mid-month, which a month bucket
+-- cannot slice.
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_agency_profitability AS
+SELECT
+    agency_id,
+    date::date AS d,
+    SUM(debit) AS debit,
+    SUM(credit) AS credit,
+    SUM(debit - credit) AS net
+FROM agency_reports
+WHERE agency_id IS NOT NULL
+AND date IS NOT NULL
+GROUP BY 1, 2;
+
+CREATE UNIQUE INDEX IF NOT EXISTS mv_agency_profitability_d_agency_idx ON mv_agency_profitability (d, agency_id);
+
+-- ==============================
+-- REFRESH
+-- ==============================
+-- The views are only as fresh as their last refresh: between refreshes the
+-- dashboard shows totals as of that moment, not the live tables.
+-- refresh_dashboard_matviews() rebuilds all four and records the time in
+-- dashboard_matview_refresh, which the dashboard shows as "Data as of".
+
+CREATE TABLE IF NOT EXISTS dashboard_matview_refresh (
+    id boolean PRIMARY KEY DEFAULT true CHECK (id),
+    refreshed_at timestamptz NOT NULL
+);
+
+-- The views above were populated when created.
+INSERT INTO dashboard_matview_refresh (refreshed_at) VALUES (now())
+ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION refresh_dashboard_matviews() RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_daily_revenue;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_daily_commissions;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_daily_bookings;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY mv_agency_profitability;
+    UPDATE dashboard_matview_refresh SET refreshed_at = now();
+END
+$$;
+
+-- Refresh hourly with pg_cron when it is installed in this database
+-- (cron.schedule() replaces an existing job of the same name). Without
+-- pg_cron, run "SELECT refresh_dashboard_matviews();" hourly from the
+-- host's scheduler instead, e.g. a crontab entry calling psql.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule('refresh-dashboard-matviews', '0 * * * *',
+                              'SELECT refresh_dashboard_matviews()');
+    ELSE
+        RAISE NOTICE 'pg_cron is not installed: schedule SELECT refresh_dashboard_matviews() hourly from an external job';
+    END IF;
+END
+$$;
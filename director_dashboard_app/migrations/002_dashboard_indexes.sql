@@ -0,0 +1,15 @@
+-- ==============================
+-- DIRECTOR DASHBOARD INDEXES
+-- ==============================
+-- Indexes matching the dashboard's WHERE / JOIN patterns on the raw tables
+-- it still queries directly. Revenue and agency profitability read the
+-- daily materialized views (001), so transactions and agency_reports get no
+-- index here: it would only add write cost on the largest tables. The
+-- bookings date index covers channel_category, so it is built in 003 once
+-- that column exists.
+--
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block: apply
+-- this file with plain psql (autocommit), not wrapped in BEGIN/COMMIT.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_vehicle_schedules_vehicle_id
+    ON vehicle_schedules (vehicle_id);
@@ -0,0 +1,33 @@
+-- ==============================
+-- BOOKING CHANNEL CATEGORY
+-- ==============================
+-- Classify booking_channel once, at write time, instead of running
+-- unanchored LIKE '%...%' patterns (which no b-tree index can serve) on
+-- every dashboard load. The first matching category wins, in the order
+-- the dashboard lists them; channels matching none stay NULL.
+--
+-- The booking overview reads passenger_id, total_price and channel_category
+-- for a created_at window; idx_bookings_created_at covers exactly those
+-- columns, so the overview runs as an index-only scan once the table has
+-- been vacuumed. Check with EXPLAIN (ANALYZE, BUFFERS): the plan should
+-- show "Index Only Scan" on it.
+--
+-- Adding a STORED generated column rewrites the table under an ACCESS
+-- EXCLUSIVE lock: run it in a maintenance window. The indexes are built
+-- CONCURRENTLY, so apply this file with plain psql (autocommit).
+
+ALTER TABLE bookings ADD COLUMN IF NOT EXISTS channel_category text
+    GENERATED ALWAYS AS (
+        CASE
+            WHEN booking_channel LIKE '%web%' OR booking_channel LIKE '%online%' OR booking_channel IS NULL THEN 'web'
+            WHEN booking_channel LIKE '%pos%' OR booking_channel LIKE '%counter%' THEN 'pos'
+            WHEN booking_channel LIKE '%mobile%' OR booking_channel LIKE '%app%' THEN 'mobile'
+            WHEN booking_channel LIKE '%b2b%' OR booking_channel LIKE '%corporate%' THEN 'b2b'
+        END
+    ) STORED;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_channel_category_created_at
+    ON bookings (channel_category, created_at) INCLUDE (total_price);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_created_at
+    ON bookings (created_at) INCLUDE (passenger_id, total_price, channel_category);
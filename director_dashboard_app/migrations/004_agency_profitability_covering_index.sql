@@ -0,0 +1,12 @@
+-- ==============================
+-- AGENCY PROFITABILITY COVERING INDEX
+-- ==============================
+-- get_agency_profitability reads the window of interest from
+-- mv_agency_profitability. Covering the summed columns lets that range
+-- come from an index-only scan, so the hash aggregate only ever sees the
+-- selected days; the ORDER BY ... LIMIT 10 then runs as a top-N heapsort.
+--
+-- Built CONCURRENTLY: apply with plain psql (autocommit).
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mv_agency_profitability_d_covering_idx
+    ON mv_agency_profitability (d) INCLUDE (agency_id, debit, credit, net);
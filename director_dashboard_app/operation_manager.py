@@ -2,13 +2,515 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
 import psycopg2
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 import matplotlib.pyplot as plt
 import json
 import os
 import streamlit as st
+from query_executor import QUERY_WORKERS, run_concurrently, submit_concurrently
+
+# Create output directory if it doesn't exist
+os.makedirs('output', exist_ok=True)
+
+# ==============================
+# DATABASE
+# ==============================
+CACHE_TTL = 300  # seconds a loaded table stays fresh
+
+
+@st.cache_resource
+def get_engine(connection_string):
+    """Create the SQLAlchemy engine (and its connection pool) once per database."""
+    # Enough persistent connections for every shared query thread, so
+    # concurrent table loads never fall back to throwaway overflow connections.
+    return create_engine(connection_string, pool_size=QUERY_WORKERS)
+
+
+# Only the columns the KPIs and charts read are fetched, instead of whole
+# tables. "end" is a reserved word in Postgres and must stay quoted.
+TABLE_QUERIES = {
+    'bookings': 'SELECT booking_status FROM bookings',
+    'trip_timings': 'SELECT trip_id, "start", "end", trip_time FROM trip_timings',
+    'trip_durations': 'SELECT trip_id, expected_duration FROM trip_durations',
+    'vehicles': 'SELECT id, registration_number, status FROM vehicles',
+    'corrective_maintenances': 'SELECT date, vehicle_id, duration FROM corrective_maintenances',
+    'attendances': 'SELECT presence_type FROM attendances',
+}
+
+TABLE_DATE_COLUMNS = {
+    'trip_timings': ['start', 'end', 'trip_time'],
+    'corrective_maintenances': ['date'],
+}
+
+
+# Low-cardinality labels stored as categories: one small integer code per row
+# instead of a string object.
+CATEGORY_COLUMNS = ['booking_status', 'presence_type', 'brand_name', 'position']
+
+
+def compact_dtypes(df):
+    """Convert label columns to categories and downcast integer columns, in place."""
+    for col in df.columns.intersection(CATEGORY_COLUMNS):
+        df[col] = df[col].astype('category')
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+def parse_durations(df):
+    """Add expected_duration as a timedelta column, parsed once at load time instead of per KPI run."""
+    if 'expected_duration' in df.columns:
+        # Via float so missing durations (NULL or NaN) become NaT on either dtype backend
+        minutes = df['expected_duration'].to_numpy(dtype='float64', na_value=np.nan)
+        df['expected_duration_td'] = pd.to_timedelta(minutes, unit='m')
+    return df
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def load_table(_engine, database_url, table):
+    """Read the projected columns of a table, cached on (database_url, table) so reruns skip the database."""
+    # Arrow-backed columns: compact strings, and integer columns with NULLs
+    # stay integers instead of falling back to float64.
+    df = pd.read_sql(
+        text(TABLE_QUERIES[table]),
+        _engine,
+        parse_dates=TABLE_DATE_COLUMNS.get(table),
+        dtype_backend='pyarrow'
+    )
+    return parse_durations(compact_dtypes(df))
+
+
+# ==============================
+# KPI CALCULATIONS
+# ==============================
+# Pure functions of the input frames. They are not cached themselves: the
+# tables are (load_table, build_sample_data), and hashing a frame for a cache
+# key costs more than the single vectorized pass each KPI makes over it.
+
+def naive_datetimes(values):
+    """A timestamp column as a datetime64 array; tz-aware columns (timestamptz) are converted to UTC first."""
+    # to_numpy() on a tz-aware column gives an object array of Timestamps,
+    # which numpy cannot add timedelta64 to.
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert(None)
+    return values.to_numpy()
+
+
+def compute_otp(trip_timings, trip_durations):
+    """Calculate On-Time Performance"""
+    if trip_timings.empty or trip_durations.empty:
+        return 0, 0
+    
+    try:
+        # Merge trip timings with durations
+        merged = pd.merge(trip_timings, trip_durations, on='trip_id', how='left', suffixes=('_timing', '_duration'))
+        
+        # Calculate departure and arrival punctuality on the raw datetime64
+        # arrays: one comparison each, no intermediate Series.
+        # Only trip_timings carries trip_time, so the merge leaves it unsuffixed.
+        trip_time = naive_datetimes(merged['trip_time']) if 'trip_time' in merged.columns else None
+        
+        if 'start' in merged.columns and trip_time is not None:
+            departed_on_time = naive_datetimes(merged['start']) <= trip_time + np.timedelta64(5, 'm')
+            departure_otp = departed_on_time.mean() * 100
+        else:
+            departure_otp = 0
+            
+        if 'end' in merged.columns and trip_time is not None and 'expected_duration_td' in merged.columns:
+            # Trips without a duration are NaT and never count as on time
+            expected = merged['expected_duration_td'].to_numpy()
+            arrived_on_time = naive_datetimes(merged['end']) <= trip_time + expected + np.timedelta64(10, 'm')
+            arrival_otp = arrived_on_time.mean() * 100
+        else:
+            arrival_otp = 0
+            
+        return departure_otp, arrival_otp
+    except Exception as e:
+        st.error(f"Error calculating OTP: {str(e)}")
+        return 0, 0
+
+
+def compute_trip_completion(bookings):
+    """Calculate trip completion and cancellation rates"""
+    if bookings.empty:
+        return 0, 0
+    
+    try:
+        total_trips = len(bookings)
+        
+        if 'booking_status' in bookings.columns:
+            # One pass over the column counts every status at once
+            counts = bookings['booking_status'].value_counts()
+            completed = counts.get('completed', 0)
+            cancelled = counts.get('cancelled', 0)
+        else:
+            completed = 0
+            cancelled = 0
+        
+        completion_rate = (completed / total_trips) * 100 if total_trips > 0 else 0
+        cancellation_rate = (cancelled / total_trips) * 100 if total_trips > 0 else 0
+        
+        return completion_rate, cancellation_rate
+    except Exception as e:
+        st.error(f"Error calculating trip completion: {str(e)}")
+        return 0, 0
+
+
+def compute_mtbf(corrective_maintenances):
+    """Calculate Mean Time Between Failures"""
+    if corrective_maintenances.empty:
+        return 0
+    
+    try:
+        maint = corrective_maintenances
+        if len(maint) < 2:
+            return 0
+        
+        # Ensure we have date column
+        if 'date' not in maint.columns:
+            return 0
+            
+        # The gaps between consecutive failures telescope, so their mean is
+        # just the span of the dates over the number of gaps: no sort needed.
+        # Dates arrive as datetime64 from both loaders
+        dates = maint['date'].dropna()
+        if len(dates) < 2:
+            return 0
+        return (dates.max() - dates.min()) / pd.Timedelta(hours=1) / (len(dates) - 1)
+    except Exception as e:
+        st.error(f"Error calculating MTBF: {str(e)}")
+        return 0
+
+
+def compute_fleet_downtime(vehicles, corrective_maintenances):
+    """Calculate fleet downtime percentage"""
+    if vehicles.empty or corrective_maintenances.empty:
+        return 0
+    
+    try:
+        corrective_maint = corrective_maintenances
+        
+        # Calculate total available time (assuming 30 days for all vehicles)
+        total_fleet_hours = len(vehicles) * 24 * 30
+        
+        # Calculate downtime from maintenance records
+        if 'duration' in corrective_maint.columns:
+            downtime_hours = corrective_maint['duration'].sum()
+        else:
+            downtime_hours = 0
+        
+        # Calculate downtime percentage
+        downtime_pct = (downtime_hours / total_fleet_hours) * 100 if total_fleet_hours > 0 else 0
+        
+        return downtime_pct
+    except Exception as e:
+        st.error(f"Error calculating fleet downtime: {str(e)}")
+        return 0
+
+
+def compute_staff_readiness(attendances):
+    """Calculate staff readiness score"""
+    if attendances.empty:
+        return 0
+    
+    try:
+        # Calculate percentage of staff present
+        if 'presence_type' in attendances.columns:
+            present_count = attendances['presence_type'].value_counts().get('present', 0)
+        else:
+            present_count = 0
+            
+        total_count = len(attendances)
+        
+        return (present_count / total_count) * 100 if total_count > 0 else 0
+    except Exception as e:
+        st.error(f"Error calculating staff readiness: {str(e)}")
+        return 0
+
+
+def compute_operational_vehicles(vehicles):
+    """Calculate number of operational vehicles"""
+    if vehicles.empty:
+        return 0
+    
+    try:
+        if 'status' in vehicles.columns:
+            return vehicles['status'].sum()
+        else:
+            return len(vehicles)
+    except Exception as e:
+        st.error(f"Error calculating operational vehicles: {str(e)}")
+        return 0
+
+
+def compute_kpis(data):
+    """All KPIs for a dict of tables, as the kpi_results dict.
+
+    The KPI functions only read their input frames, so they run side by
+    side on the shared query threads.
+    """
+    results = run_concurrently({
+        'otp': lambda: compute_otp(data['trip_timings'], data['trip_durations']),
+        'trip_completion': lambda: compute_trip_completion(data['bookings']),
+        'mtbf': lambda: compute_mtbf(data['corrective_maintenances']),
+        'downtime_pct': lambda: compute_fleet_downtime(data['vehicles'], data['corrective_maintenances']),
+        'staff_readiness': lambda: compute_staff_readiness(data['attendances']),
+        'operational_vehicles': lambda: compute_operational_vehicles(data['vehicles']),
+    })
+    kpi_results = {}
+    
+    # On-Time Performance
+    departure_otp, arrival_otp = results['otp']
+    kpi_results['departure_otp'] = departure_otp
+    kpi_results['arrival_otp'] = arrival_otp
+    
+    # Trip Completion
+    completion_rate, cancellation_rate = results['trip_completion']
+    kpi_results['completion_rate'] = completion_rate
+    kpi_results['cancellation_rate'] = cancellation_rate
+    
+    # MTBF
+    kpi_results['mtbf'] = results['mtbf']
+    
+    # Fleet Downtime
+    kpi_results['downtime_pct'] = results['downtime_pct']
+    
+    # Staff Readiness
+    kpi_results['staff_readiness'] = results['staff_readiness']
+    
+    # Operational Vehicles
+    kpi_results['operational_vehicles'] = results['operational_vehicles']
+    kpi_results['total_vehicles'] = len(data['vehicles'])
+    
+    return kpi_results
+
+
+# ==============================
+# SAMPLE DATA
+# ==============================
+SAMPLE_SEED = 42  # seeds every demo-data draw, so cached demo output is reproducible
+
+@st.cache_data(show_spinner=False)
+def build_sample_data():
+    """Demo-mode tables, generated once per process from a fixed seed and reused by every rerun."""
+    rng = np.random.default_rng(SAMPLE_SEED)
+    data = {}
+    
+    # Columns are built as whole arrays rather than per-row Python loops
+    now = pd.Timestamp.now()
+    trip_ids = 'TRIP' + pd.Series(np.arange(1, 101)).astype(str).str.zfill(3)
+    letters = pd.Series(list('ABCDEFGHIJ'))
+    
+    # Sample bookings data
+    data['bookings'] = pd.DataFrame({
+        'id': np.arange(1, 101),
+        'booking_status': rng.choice(['completed', 'cancelled', 'pending'], 100, p=[0.8, 0.1, 0.1]),
+        'created_at': now - pd.to_timedelta(rng.integers(1, 30, 100), unit='D'),
+        'trip': trip_ids,
+        'route_id': rng.integers(1, 6, 100)
+    })
+    
+    # Sample trip timings
+    data['trip_timings'] = pd.DataFrame({
+        'trip_id': trip_ids,
+        'start': now.replace(hour=8, minute=0) + pd.to_timedelta(rng.integers(-15, 30, 100), unit='m'),
+        'end': now.replace(hour=12, minute=0) + pd.to_timedelta(rng.integers(-15, 30, 100), unit='m'),
+        'trip_time': now.replace(hour=8, minute=0)
+    })
+    
+    # Sample trip durations
+    data['trip_durations'] = pd.DataFrame({
+        'trip_id': trip_ids,
+        'expected_duration': rng.integers(180, 300, 100),  # 3-5 hours
+        'real_duration': rng.integers(170, 310, 100),
+        'status': rng.choice(['on_time', 'delayed'], 100, p=[0.8, 0.2])
+    })
+    
+    # Sample vehicles data
+    data['vehicles'] = pd.DataFrame({
+        'id': np.arange(1, 21),
+        'registration_number': 'VEH' + pd.Series(np.arange(1, 21)).astype(str).str.zfill(3),
+        'status': np.arange(20) < 15,  # 15 operational, 5 not
+        'brand_name': rng.choice(['Mercedes', 'Volvo', 'Scania', 'MAN'], 20)
+    })
+    
+    # Sample corrective maintenances
+    maintenance_dates = (now - pd.to_timedelta(rng.integers(1, 90, 30), unit='D')).sort_values()
+    
+    data['corrective_maintenances'] = pd.DataFrame({
+        'id': np.arange(1, 31),
+        'date': maintenance_dates,
+        'vehicle_id': rng.integers(1, 21, 30),
+        'duration': rng.integers(2, 48, 30),  # 2-48 hours
+        'name': 'Maintenance ' + pd.Series(np.arange(1, 31)).astype(str)
+    })
+    
+    # Sample users (drivers)
+    data['users'] = pd.DataFrame({
+        'id': np.arange(1, 11),
+        'firstname': 'Driver' + letters,
+        'lastname': 'Last' + letters,
+        'position': 'Driver'
+    })
+    
+    # Sample attendances
+    data['attendances'] = pd.DataFrame({
+        'id': np.arange(1, 51),
+        'user_id': rng.integers(1, 11, 50),
+        'date': now.normalize() - pd.to_timedelta(np.arange(50), unit='D'),
+        'presence_type': rng.choice(['present', 'absent', 'sick'], 50, p=[0.8, 0.1, 0.1])
+    })
+    
+    # Sample routes
+    data['routes'] = pd.DataFrame({
+        'id': np.arange(1, 6),
+        'name': 'Route ' + letters[:5],
+        'number': 'R' + pd.Series(np.arange(100, 105)).astype(str)
+    })
+    
+    for df in data.values():
+        parse_durations(compact_dtypes(df))
+    
+    return data
+
+
+@st.cache_data(show_spinner=False)
+def compute_demo_kpis():
+    """Every KPI for the fixed demo tables, computed once per process."""
+    return compute_kpis(build_sample_data())
+
+
+# ==============================
+# CHARTS
+# ==============================
+# Figures keyed on a few KPI values (or nothing) are kept with
+# st.cache_resource: a hit returns the same figure object, whereas
+# st.cache_data would unpickle it and re-run Plotly's validation, costing
+# more than a fresh build. The shared figures are only read, never updated
+# after they are returned. The reliability chart is plotted from whole
+# frames and is built fresh: hashing them would cost more than the chart.
+
+# Everything the two OTP gauges share; only value, title and domain differ
+OTP_GAUGE_STYLE = dict(
+    mode = "gauge+number",
+    number = {'suffix': '%'},
+    gauge = {
+        'axis': {'range': [0, 100]},
+        'bar': {'color': "darkblue"},
+        'steps': [
+            {'range': [0, 85], 'color': "lightgray"},
+            {'range': [85, 95], 'color': "gray"},
+            {'range': [95, 100], 'color': "lightgreen"}
+        ]
+    }
+)
+OTP_LAYOUT = dict(height=300, margin=dict(l=50, r=50, b=50, t=50))
+
+def make_gauge(value, title, domain):
+    """Build one OTP gauge trace in the shared style"""
+    return go.Indicator(value=value, title={'text': title}, domain=domain, **OTP_GAUGE_STYLE)
+
+
+@st.cache_resource(show_spinner=False)
+def build_otp_chart(departure_otp, arrival_otp):
+    """Create OTP gauge charts"""
+    return go.Figure(
+        data=[
+            make_gauge(departure_otp, "On-Time Departure %", {'x': [0, 0.5], 'y': [0, 1]}),
+            make_gauge(arrival_otp, "On-Time Arrival %", {'x': [0.5, 1], 'y': [0, 1]})
+        ],
+        layout=go.Layout(**OTP_LAYOUT)
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def build_trip_breakdown_chart(completion_rate, cancellation_rate):
+    """Create trip breakdown pie chart"""
+    labels = ['Completed', 'Cancelled', 'Other']
+    values = [
+        completion_rate, 
+        cancellation_rate, 
+        max(0, 100 - completion_rate - cancellation_rate)
+    ]
+    
+    fig = px.pie(values=values, names=labels, title='Trip Completion Breakdown')
+    fig.update_traces(textinfo='percent+label')
+    return fig
+
+
+@st.cache_resource(show_spinner=False)
+def build_delay_root_cause_chart():
+    """Create delay root cause pie chart"""
+    # Using placeholder data
+    reasons = ['Traffic', 'Mechanical Issues', 'Weather', 'Staff Availability', 'Other']
+    counts = [35, 25, 20, 15, 5]
+    
+    fig = px.pie(values=counts, names=reasons, title='Delay Root Causes')
+    fig.update_traces(textinfo='percent+label')
+    return fig
+
+
+def build_vehicle_reliability_chart(vehicles, corrective_maintenances):
+    """Create vehicle reliability scorecard"""
+    if vehicles.empty or corrective_maintenances.empty:
+        return px.bar(title='No vehicle data available')
+    
+    try:
+        # Count maintenance events per vehicle, aligned to the vehicles table
+        # (maintenances reference vehicles.id through vehicle_id)
+        maint_count = (
+            corrective_maintenances.groupby('vehicle_id', observed=True).size()
+            .reindex(vehicles['id'], fill_value=0)
+            .to_numpy()
+        )
+        
+        # Create reliability score (lower maintenance count = higher reliability)
+        max_count = maint_count.max() or 1
+        reliability_score = pd.Series(
+            100 - maint_count * (100 / max_count),
+            index=vehicles['registration_number'].to_numpy()
+        )
+        
+        # Get top 10 vehicles by reliability
+        top_vehicles = reliability_score.nlargest(10)
+        
+        # Create chart
+        fig = px.bar(
+            x=top_vehicles.to_numpy(),
+            y=top_vehicles.index,
+            orientation='h',
+            title='Top 10 Vehicles by Reliability Score'
+        )
+        fig.update_layout(yaxis_title='Vehicle', xaxis_title='Reliability Score')
+        return fig
+    except Exception as e:
+        st.error(f"Error creating vehicle reliability chart: {str(e)}")
+        return px.bar(title='Error loading vehicle data')
+
+
+@st.cache_resource(show_spinner=False)
+def build_driver_performance_chart():
+    """Create driver performance radar chart"""
+    # Using placeholder data
+    drivers = ['Driver A', 'Driver B', 'Driver C', 'Driver D']
+    categories = ['Punctuality', 'Safety', 'Fuel Efficiency', 'Customer Satisfaction', 'Route Knowledge']
+    
+    # All scores in one draw, one row per driver
+    scores = np.random.default_rng(SAMPLE_SEED).integers(70, 100, (len(drivers), len(categories)))
+    traces = [
+        go.Scatterpolar(r=driver_scores, theta=categories, fill='toself', name=driver)
+        for driver, driver_scores in zip(drivers, scores)
+    ]
+    
+    return go.Figure(
+        data=traces,
+        layout=go.Layout(
+            polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
+            title='Driver Performance by Category'
+        )
+    )
+
 
 class OperationsDashboard:
     def __init__(self, db_config=None):
@@ -16,9 +518,6 @@ class OperationsDashboard:
         self.data = {}
         self.kpi_results = {}
         
-        # Create output directory if it doesn't exist
-        os.makedirs('output', exist_ok=True)
-        
         if db_config:
             self.engine = self.init_connection()
         else:
@@ -27,81 +526,13 @@ class OperationsDashboard:
     
     def init_connection(self):
         """Initialize database connection"""
-        connection_string = f"postgresql://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/{self.db_config['database']}"
-        return create_engine(connection_string)
+        connection_string = f"postgresql+psycopg2://{self.db_config['user']}:{self.db_config['password']}@{self.db_config['host']}:{self.db_config['port']}/{self.db_config['database']}"
+        return get_engine(connection_string)
     
     def generate_sample_data(self):
         """Generate sample data for testing without database"""
         st.info("Generating sample data...")
-        
-        # Sample bookings data
-        self.data['bookings'] = pd.DataFrame({
-            'id': range(1, 101),
-            'booking_status': np.random.choice(['completed', 'cancelled', 'pending'], 100, p=[0.8, 0.1, 0.1]),
-            'created_at': [datetime.now() - timedelta(days=np.random.randint(1, 30)) for _ in range(100)],
-            'trip': [f"TRIP{str(i).zfill(3)}" for i in range(1, 101)],
-            'route_id': np.random.randint(1, 6, 100)
-        })
-        
-        # Sample trip timings
-        self.data['trip_timings'] = pd.DataFrame({
-            'trip_id': [f"TRIP{str(i).zfill(3)}" for i in range(1, 101)],
-            'start': [datetime.now().replace(hour=8, minute=0) + timedelta(minutes=np.random.randint(-15, 30)) for _ in range(100)],
-            'end': [datetime.now().replace(hour=12, minute=0) + timedelta(minutes=np.random.randint(-15, 30)) for _ in range(100)],
-            'trip_time': [datetime.now().replace(hour=8, minute=0) for _ in range(100)]
-        })
-        
-        # Sample trip durations
-        self.data['trip_durations'] = pd.DataFrame({
-            'trip_id': [f"TRIP{str(i).zfill(3)}" for i in range(1, 101)],
-            'expected_duration': np.random.randint(180, 300, 100),  # 3-5 hours
-            'real_duration': np.random.randint(170, 310, 100),
-            'status': np.random.choice(['on_time', 'delayed'], 100, p=[0.8, 0.2])
-        })
-        
-        # Sample vehicles data
-        self.data['vehicles'] = pd.DataFrame({
-            'id': range(1, 21),
-            'registration_number': [f"VEH{str(i).zfill(3)}" for i in range(1, 21)],
-            'status': [True] * 15 + [False] * 5,  # 15 operational, 5 not
-            'brand_name': np.random.choice(['Mercedes', 'Volvo', 'Scania', 'MAN'], 20)
-        })
-        
-        # Sample corrective maintenances
-        maintenance_dates = [datetime.now() - timedelta(days=np.random.randint(1, 90)) for _ in range(30)]
-        maintenance_dates.sort()
-        
-        self.data['corrective_maintenances'] = pd.DataFrame({
-            'id': range(1, 31),
-            'date': maintenance_dates,
-            'vehicle_id': np.random.randint(1, 21, 30),
-            'duration': np.random.randint(2, 48, 30),  # 2-48 hours
-            'name': [f"Maintenance {i}" for i in range(1, 31)]
-        })
-        
-        # Sample users (drivers)
-        self.data['users'] = pd.DataFrame({
-            'id': range(1, 11),
-            'firstname': [f"Driver{chr(65+i)}" for i in range(10)],
-            'lastname': [f"Last{chr(65+i)}" for i in range(10)],
-            'position': ['Driver'] * 10
-        })
-        
-        # Sample attendances
-        self.data['attendances'] = pd.DataFrame({
-            'id': range(1, 51),
-            'user_id': np.random.randint(1, 11, 50),
-            'date': [datetime.now().date() - timedelta(days=i) for i in range(50)],
-            'presence_type': np.random.choice(['present', 'absent', 'sick'], 50, p=[0.8, 0.1, 0.1])
-        })
-        
-        # Sample routes
-        self.data['routes'] = pd.DataFrame({
-            'id': range(1, 6),
-            'name': [f"Route {chr(65+i)}" for i in range(5)],
-            'number': [f"R{100+i}" for i in range(5)]
-        })
-        
+        self.data = build_sample_data()
         st.success("Sample data generated successfully!")
     
     def load_data_from_db(self):
@@ -112,16 +543,17 @@ class OperationsDashboard:
         
         st.info("Loading data from database...")
         
-        # Load all necessary tables
-        table_names = [
-            'bookings', 'vehicle_schedules', 'trip_timings', 'trip_durations',
-            'vehicles', 'corrective_maintenances', 'users', 'routes',
-            'booking_operations', 'maintenance_tasks', 'attendances', 'shifts'
-        ]
+        # Load the tables the KPIs and charts actually use, all at once, each
+        # on its own pooled connection; results are reported in table order.
+        database_url = str(self.engine.url)
+        futures = submit_concurrently({
+            table: lambda table=table: load_table(self.engine, database_url, table)
+            for table in TABLE_QUERIES
+        })
         
-        for table in table_names:
+        for table, future in futures.items():
             try:
-                self.data[table] = pd.read_sql_table(table, self.engine)
+                self.data[table] = future.result()
                 st.success(f"Loaded {table} ({len(self.data[table])} rows)")
             except Exception as e:
                 st.warning(f"Could not load {table}: {str(e)}")
@@ -133,171 +565,37 @@ class OperationsDashboard:
         """Calculate all KPIs"""
         st.info("Calculating KPIs...")
         
-        # On-Time Performance
-        departure_otp, arrival_otp = self.calculate_otp()
-        self.kpi_results['departure_otp'] = departure_otp
-        self.kpi_results['arrival_otp'] = arrival_otp
-        
-        # Trip Completion
-        completion_rate, cancellation_rate = self.calculate_trip_completion()
-        self.kpi_results['completion_rate'] = completion_rate
-        self.kpi_results['cancellation_rate'] = cancellation_rate
-        
-        # MTBF
-        mtbf = self.calculate_mtbf()
-        self.kpi_results['mtbf'] = mtbf
-        
-        # Fleet Downtime
-        downtime_pct = self.calculate_fleet_downtime()
-        self.kpi_results['downtime_pct'] = downtime_pct
-        
-        # Staff Readiness
-        staff_readiness = self.calculate_staff_readiness()
-        self.kpi_results['staff_readiness'] = staff_readiness
-        
-        # Operational Vehicles
-        operational_vehicles = self.calculate_operational_vehicles()
-        self.kpi_results['operational_vehicles'] = operational_vehicles
-        self.kpi_results['total_vehicles'] = len(self.data['vehicles']) if not self.data['vehicles'].empty else 0
+        # Demo data never changes, so its KPIs come straight from the cache
+        if self.db_config is None:
+            self.kpi_results = compute_demo_kpis()
+        else:
+            self.kpi_results = compute_kpis(self.data)
         
         st.success("KPI calculation completed!")
     
     def calculate_otp(self):
         """Calculate On-Time Performance"""
-        if self.data['trip_timings'].empty or self.data['trip_durations'].empty:
-            return 0, 0
-        
-        try:
-            # Merge trip timings with durations
-            merged = pd.merge(self.data['trip_timings'], self.data['trip_durations'], on='trip_id', how='left', suffixes=('_timing', '_duration'))
-            
-            # Calculate departure and arrival punctuality
-            if 'start' in merged.columns and 'trip_time_timing' in merged.columns:
-                merged['departed_on_time'] = merged['start'] <= (merged['trip_time_timing'] + pd.Timedelta(minutes=5))
-                departure_otp = (merged['departed_on_time'].sum() / len(merged)) * 100
-            else:
-                departure_otp = 0
-                
-            if 'end' in merged.columns and 'expected_duration' in merged.columns:
-                merged['arrived_on_time'] = merged['end'] <= (merged['trip_time_timing'] + pd.to_timedelta(merged['expected_duration'], unit='m') + pd.Timedelta(minutes=10))
-                arrival_otp = (merged['arrived_on_time'].sum() / len(merged)) * 100
-            else:
-                arrival_otp = 0
-                
-            return departure_otp, arrival_otp
-        except Exception as e:
-            st.error(f"Error calculating OTP: {str(e)}")
-            return 0, 0
+        return compute_otp(self.data['trip_timings'], self.data['trip_durations'])
 
     def calculate_trip_completion(self):
         """Calculate trip completion and cancellation rates"""
-        if self.data['bookings'].empty:
-            return 0, 0
-        
-        try:
-            bookings = self.data['bookings']
-            total_trips = len(bookings)
-            
-            if 'booking_status' in bookings.columns:
-                completed = bookings[bookings['booking_status'] == 'completed'].shape[0]
-                cancelled = bookings[bookings['booking_status'] == 'cancelled'].shape[0]
-            else:
-                completed = 0
-                cancelled = 0
-            
-            completion_rate = (completed / total_trips) * 100 if total_trips > 0 else 0
-            cancellation_rate = (cancelled / total_trips) * 100 if total_trips > 0 else 0
-            
-            return completion_rate, cancellation_rate
-        except Exception as e:
-            st.error(f"Error calculating trip completion: {str(e)}")
-            return 0, 0
+        return compute_trip_completion(self.data['bookings'])
 
     def calculate_mtbf(self):
         """Calculate Mean Time Between Failures"""
-        if self.data['corrective_maintenances'].empty:
-            return 0
-        
-        try:
-            maint = self.data['corrective_maintenances']
-            if len(maint) < 2:
-                return 0
-            
-            # Ensure we have date column
-            if 'date' not in maint.columns:
-                return 0
-                
-            # Sort by date and calculate time between failures
-            maint = maint.sort_values('date')
-            maint['date'] = pd.to_datetime(maint['date'])
-            time_diffs = maint['date'].diff().dt.total_seconds() / 3600  # Convert to hours
-            
-            # Calculate average (ignore first NaN value)
-            return time_diffs.mean() if len(time_diffs) > 1 else 0
-        except Exception as e:
-            st.error(f"Error calculating MTBF: {str(e)}")
-            return 0
+        return compute_mtbf(self.data['corrective_maintenances'])
 
     def calculate_fleet_downtime(self):
         """Calculate fleet downtime percentage"""
-        if self.data['vehicles'].empty or self.data['corrective_maintenances'].empty:
-            return 0
-        
-        try:
-            vehicles = self.data['vehicles']
-            corrective_maint = self.data['corrective_maintenances']
-            
-            # Calculate total available time (assuming 30 days for all vehicles)
-            total_fleet_hours = len(vehicles) * 24 * 30
-            
-            # Calculate downtime from maintenance records
-            if 'duration' in corrective_maint.columns:
-                downtime_hours = corrective_maint['duration'].sum()
-            else:
-                downtime_hours = 0
-            
-            # Calculate downtime percentage
-            downtime_pct = (downtime_hours / total_fleet_hours) * 100 if total_fleet_hours > 0 else 0
-            
-            return downtime_pct
-        except Exception as e:
-            st.error(f"Error calculating fleet downtime: {str(e)}")
-            return 0
+        return compute_fleet_downtime(self.data['vehicles'], self.data['corrective_maintenances'])
 
     def calculate_staff_readiness(self):
         """Calculate staff readiness score"""
-        if self.data['attendances'].empty:
-            return 0
-        
-        try:
-            attendances = self.data['attendances']
-            
-            # Calculate percentage of staff present
-            if 'presence_type' in attendances.columns:
-                present_count = attendances[attendances['presence_type'] == 'present'].shape[0]
-            else:
-                present_count = 0
-                
-            total_count = len(attendances)
-            
-            return (present_count / total_count) * 100 if total_count > 0 else 0
-        except Exception as e:
-            st.error(f"Error calculating staff readiness: {str(e)}")
-            return 0
+        return compute_staff_readiness(self.data['attendances'])
 
     def calculate_operational_vehicles(self):
         """Calculate number of operational vehicles"""
-        if self.data['vehicles'].empty:
-            return 0
-        
-        try:
-            if 'status' in self.data['vehicles'].columns:
-                return self.data['vehicles']['status'].sum()
-            else:
-                return len(self.data['vehicles'])
-        except Exception as e:
-            st.error(f"Error calculating operational vehicles: {str(e)}")
-            return 0
+        return compute_operational_vehicles(self.data['vehicles'])
 
     def create_visualizations(self):
         """Create all visualizations"""
@@ -332,128 +630,34 @@ class OperationsDashboard:
 
     def create_otp_chart(self):
         """Create OTP gauge charts"""
-        fig = go.Figure()
-        
-        fig.add_trace(go.Indicator(
-            mode = "gauge+number",
-            value = self.kpi_results['departure_otp'],
-            number = {'suffix': '%'},
-            title = {'text': "On-Time Departure %"},
-            domain = {'x': [0, 0.5], 'y': [0, 1]},
-            gauge = {
-                'axis': {'range': [0, 100]},
-                'bar': {'color': "darkblue"},
-                'steps': [
-                    {'range': [0, 85], 'color': "lightgray"},
-                    {'range': [85, 95], 'color': "gray"},
-                    {'range': [95, 100], 'color': "lightgreen"}
-                ]
-            }
-        ))
-        
-        fig.add_trace(go.Indicator(
-            mode = "gauge+number",
-            value = self.kpi_results['arrival_otp'],
-            number = {'suffix': '%'},
-            title = {'text': "On-Time Arrival %"},
-            domain = {'x': [0.5, 1], 'y': [0, 1]},
-            gauge = {
-                'axis': {'range': [0, 100]},
-                'bar': {'color': "darkblue"},
-                'steps': [
-                    {'range': [0, 85], 'color': "lightgray"},
-                    {'range': [85, 95], 'color': "gray"},
-                    {'range': [95, 100], 'color': "lightgreen"}
-                ]
-            }
-        ))
-        
-        fig.update_layout(height=300, margin=dict(l=50, r=50, b=50, t=50))
-        return fig
+        return build_otp_chart(self.kpi_results['departure_otp'], self.kpi_results['arrival_otp'])
 
     def create_trip_breakdown_chart(self):
         """Create trip breakdown pie chart"""
-        labels = ['Completed', 'Cancelled', 'Other']
-        values = [
-            self.kpi_results['completion_rate'], 
-            self.kpi_results['cancellation_rate'], 
-            max(0, 100 - self.kpi_results['completion_rate'] - self.kpi_results['cancellation_rate'])
-        ]
-        
-        fig = px.pie(values=values, names=labels, title='Trip Completion Breakdown')
-        fig.update_traces(textinfo='percent+label')
-        return fig
+        return build_trip_breakdown_chart(self.kpi_results['completion_rate'], self.kpi_results['cancellation_rate'])
 
     def create_delay_root_cause_chart(self):
         """Create delay root cause pie chart"""
-        # Using placeholder data
-        reasons = ['Traffic', 'Mechanical Issues', 'Weather', 'Staff Availability', 'Other']
-        counts = [35, 25, 20, 15, 5]
-        
-        fig = px.pie(values=counts, names=reasons, title='Delay Root Causes')
-        fig.update_traces(textinfo='percent+label')
-        return fig
+        return build_delay_root_cause_chart()
 
     def create_vehicle_reliability_chart(self):
         """Create vehicle reliability scorecard"""
-        if self.data['vehicles'].empty or self.data['corrective_maintenances'].empty:
-            return px.bar(title='No vehicle data available')
-        
-        try:
-            vehicles = self.data['vehicles']
-            corrective_maint = self.data['corrective_maintenances']
-            
-            # Count maintenance events per vehicle
-            maint_count = corrective_maint['vehicle_id'].value_counts().reset_index()
-            maint_count.columns = ['vehicle_id', 'maintenance_count']
-            
-            # Merge with vehicle data
-            vehicle_reliability = pd.merge(vehicles, maint_count, on='vehicle_id', how='left')
-            vehicle_reliability['maintenance_count'] = vehicle_reliability['maintenance_count'].fillna(0)
-            
-            # Create reliability score (lower maintenance count = higher reliability)
-            max_count = vehicle_reliability['maintenance_count'].max() if len(vehicle_reliability) > 0 else 1
-            vehicle_reliability['reliability_score'] = 100 - (vehicle_reliability['maintenance_count'] / max_count * 100)
-            
-            # Get top 10 vehicles by reliability
-            top_vehicles = vehicle_reliability.nlargest(10, 'reliability_score')
-            
-            # Create chart
-            fig = px.bar(
-                top_vehicles,
-                x='reliability_score', 
-                y='registration_number',
-                orientation='h',
-                title='Top 10 Vehicles by Reliability Score'
-            )
-            fig.update_layout(yaxis_title='Vehicle', xaxis_title='Reliability Score')
-            return fig
-        except Exception as e:
-            st.error(f"Error creating vehicle reliability chart: {str(e)}")
-            return px.bar(title='Error loading vehicle data')
+        # In database mode the tables are only loaded on the run that clicks
+        # "Load Data from Database"; without them the chart says so.
+        return build_vehicle_reliability_chart(
+            self.data.get('vehicles', pd.DataFrame()),
+            self.data.get('corrective_maintenances', pd.DataFrame())
+        )
 
     def create_driver_performance_chart(self):
         """Create driver performance radar chart"""
-        # Using placeholder data
-        drivers = ['Driver A', 'Driver B', 'Driver C', 'Driver D']
-        categories = ['Punctuality', 'Safety', 'Fuel Efficiency', 'Customer Satisfaction', 'Route Knowledge']
-        
-        fig = go.Figure()
-        
-        for driver in drivers:
-            fig.add_trace(go.Scatterpolar(
-                r=[np.random.randint(70, 100) for _ in range(5)],
-                theta=categories,
-                fill='toself',
-                name=driver
-            ))
-        
-        fig.update_layout(
-            polar=dict(radialaxis=dict(visible=True, range=[0, 100])),
-            title='Driver Performance by Category'
-        )
-        
-        return fig
+        return build_driver_performance_chart()
+
+    def kpi_state_key(self):
+        """Session-state key for this dashboard's KPI results, separate for demo mode and each database"""
+        if self.db_config is None:
+            return 'kpi_results:demo'
+        return "kpi_results:{user}@{host}:{port}/{database}".format(**self.db_config)
 
     def generate_report(self):
         """Generate a comprehensive report"""
@@ -505,9 +709,14 @@ def main():
     if st.sidebar.button("Calculate KPIs"):
         dashboard.calculate_kpis()
         dashboard.generate_report()
+        # Each button click is a new run with a new dashboard; keep the
+        # results so the visualizations can be drawn on a later click. Keyed
+        # per mode, so demo figures never show up as database ones.
+        st.session_state[dashboard.kpi_state_key()] = dashboard.kpi_results
     
     # Create visualizations
     if st.sidebar.button("Generate Visualizations"):
+        dashboard.kpi_results = dashboard.kpi_results or st.session_state.get(dashboard.kpi_state_key(), {})
         if not dashboard.kpi_results:
             st.warning("Please calculate KPIs first")
         else:
@@ -0,0 +1,61 @@
+import streamlit as st
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+try:
+    from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+except ImportError:  # Streamlit < 1.38 keeps the module under scriptrunner
+    from streamlit.runtime.scriptrunner.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+# ==============================
+# SHARED QUERY THREADS
+# ==============================
+# Used by both dashboards for independent queries and calculations that can
+# run side by side.
+QUERY_WORKERS = 8  # threads shared by every rerun and session of the app
+
+
+@st.cache_resource
+def get_query_executor():
+    """Worker threads shared by every rerun and session instead of spawned per call."""
+    return ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="dashboard-query")
+
+
+def submit_concurrently(tasks):
+    """Submit independent callables to the shared executor.
+
+    Takes a dict of name -> callable and returns a dict of name -> Future,
+    so callers can handle each task's failure on its own.
+    """
+    ctx = get_script_run_ctx()
+
+    def with_ctx(fn):
+        # Pooled threads serve many sessions, so the calling script's context
+        # is attached per task; cache lookups and st.* calls inside the task
+        # then behave as they do on the main thread. The thread's previous
+        # context is put back afterwards, so an idle worker does not keep a
+        # finished session alive or write to its page.
+        def task():
+            thread = threading.current_thread()
+            previous = get_script_run_ctx(suppress_warning=True)
+            add_script_run_ctx(ctx=ctx)
+            try:
+                return fn()
+            finally:
+                # add_script_run_ctx() ignores None, so restore the attribute directly
+                setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, previous)
+        return task
+
+    executor = get_query_executor()
+    return {name: executor.submit(with_ctx(fn)) for name, fn in tasks.items()}
+
+
+def run_concurrently(tasks):
+    """Run independent callables in parallel.
+
+    Takes a dict of name -> callable and returns a dict of name -> result;
+    the first failure is raised.
+    """
+    futures = submit_concurrently(tasks)
+    return {name: future.result() for name, future in futures.items()}